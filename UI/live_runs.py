@@ -0,0 +1,147 @@
+import array
+import collections
+import json
+import os
+import tempfile
+import threading
+import uuid
+
+# Number of recent events kept in memory per run (older events are read back from the run log)
+RUN_BUFFER_SIZE = int(os.environ.get('RUN_BUFFER_SIZE', '10000'))
+RUN_LOG_DIR = os.environ.get('RUN_LOG_DIR', os.path.join(tempfile.gettempdir(), 'policy_runs'))
+# Finished runs kept attachable before the oldest ones are dropped from the registry
+MAX_FINISHED_RUNS = int(os.environ.get('MAX_FINISHED_RUNS', '20'))
+# Seconds a subscriber waits for a new event before a keep-alive is sent
+HEARTBEAT_SECONDS = 15
+
+# Sent (without an id) when events to replay are gone because the run log was deleted
+LOG_UNAVAILABLE_EVENT = json.dumps({'type': 'error', 'data': 'Run log no longer available; earlier events cannot be replayed'})
+
+
+class LiveRun:
+    """Events of one pipeline run with sequential ids, shared by any number of subscribers"""
+
+    def __init__(self, run_id, log_dir=None):
+        log_dir = log_dir or RUN_LOG_DIR
+        os.makedirs(log_dir, exist_ok=True)
+        self.run_id = run_id
+        self.log_path = os.path.join(log_dir, f"{run_id}.jsonl")
+        self.events = collections.deque(maxlen=RUN_BUFFER_SIZE)
+        self.last_id = 0
+        self.finished = False
+        # Number of active events_after generators (runs with subscribers keep their log)
+        self.subscribers = 0
+        self.condition = threading.Condition()
+        # Byte offset of every event in the run log (index = id - 1), so replays seek instead of scanning
+        self._offsets = array.array('q')
+        self._log_size = 0
+        self._log = open(self.log_path, 'ab')
+
+    def publish(self, data):
+        """Append an event (already serialized JSON string) and wake up subscribers"""
+        with self.condition:
+            self.last_id += 1
+            self.events.append((self.last_id, data))
+            line = (json.dumps({'id': self.last_id, 'data': data}, ensure_ascii=False) + '\n').encode('utf-8')
+            self._offsets.append(self._log_size)
+            self._log.write(line)
+            self._log.flush()
+            self._log_size += len(line)
+            self.condition.notify_all()
+            return self.last_id
+
+    def finish(self):
+        with self.condition:
+            self.finished = True
+            self._log.close()
+            self.condition.notify_all()
+
+    def delete_log(self):
+        try:
+            os.remove(self.log_path)
+        except FileNotFoundError:
+            pass
+
+    def _read_log(self, after_id, up_to_id):
+        # Events up to up_to_id are completely written; later lines may still be in progress
+        # (raises FileNotFoundError if the run was evicted and its log deleted)
+        with open(self.log_path, 'rb') as f:
+            f.seek(self._offsets[after_id])
+            for line in f:
+                entry = json.loads(line)
+                yield entry['id'], entry['data']
+                if entry['id'] >= up_to_id:
+                    break
+
+    def events_after(self, last_event_id=0):
+        """Yield (id, data) for every event after last_event_id until the run finishes
+
+        Yields (None, None) when no event arrived within HEARTBEAT_SECONDS, and (None, LOG_UNAVAILABLE_EVENT)
+        before ending early if events to replay are no longer available.
+        """
+        with self.condition:
+            self.subscribers += 1
+        try:
+            yield from self._events_after(max(last_event_id, 0))
+        finally:
+            with self.condition:
+                self.subscribers -= 1
+
+    def _events_after(self, cursor):
+        while True:
+            replay_up_to = None
+            with self.condition:
+                first_buffered = self.events[0][0] if self.events else self.last_id + 1
+                if cursor + 1 < first_buffered:
+                    # Events no longer in the ring buffer are replayed from the run log
+                    replay_up_to = first_buffered - 1
+                    pending = []
+                else:
+                    pending = [event for event in self.events if event[0] > cursor]
+                    if not pending:
+                        if self.finished:
+                            return
+                        if not self.condition.wait(HEARTBEAT_SECONDS):
+                            pending = [(None, None)]
+
+            if replay_up_to is not None:
+                try:
+                    for event in self._read_log(cursor, replay_up_to):
+                        yield event
+                        cursor = event[0]
+                except FileNotFoundError:
+                    yield None, LOG_UNAVAILABLE_EVENT
+                    return
+                cursor = replay_up_to
+                continue
+
+            for event_id, data in pending:
+                yield event_id, data
+                if event_id is not None:
+                    cursor = event_id
+
+
+_runs = collections.OrderedDict()
+_runs_lock = threading.Lock()
+
+
+def create_run():
+    """Register a new run and return it"""
+    run = LiveRun(str(uuid.uuid4()))
+    with _runs_lock:
+        _runs[run.run_id] = run
+        # Runs that still have subscribers are not evicted, so their log stays available for replays
+        finished = [run_id for run_id, r in _runs.items() if r.finished and not r.subscribers]
+        for run_id in finished[:max(len(finished) - MAX_FINISHED_RUNS, 0)]:
+            _runs.pop(run_id).delete_log()
+    return run
+
+
+def get_run(run_id):
+    with _runs_lock:
+        return _runs.get(run_id)
+
+
+def list_runs():
+    with _runs_lock:
+        return [{'run_id': run.run_id, 'last_event_id': run.last_id, 'finished': run.finished} for run in _runs.values()]
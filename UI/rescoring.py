@@ -0,0 +1,326 @@
+import copy
+import itertools
+import json
+import math
+import os
+
+# Weights and thresholds used by the pipeline (see score_table in multi_agent_app_enhanced_en.py)
+DEFAULT_WEIGHTS = {
+    "citizen_overall": {"personal_impact": 0.5, "family_impact": 0.2, "community_impact": 0.1, "fairness": 0.1, "sustainability": 0.1},
+    "effectiveness": {"personal_impact": 0.5, "family_impact": 0.2, "community_impact": 0.1},
+    "citizen_share": {"equity": 0.5, "sustainability": 0.5},
+    "final": {"equity": 0.25, "effectiveness": 0.25, "transparency": 0.20, "sustainability": 0.15, "ethical_acceptability": 0.10},
+    "review": {"legal_compliance": 0.5, "feasibility": 0.5},
+    "review_approval_threshold": 80,
+    "recommendation_thresholds": {"recommended": 70, "conditional": 50}
+}
+
+CITIZEN_DIMENSIONS = list(DEFAULT_WEIGHTS["citizen_overall"])
+SEGMENTS = ["all", "directly_affected", "not_directly_affected"]
+
+# Upper bound on the number of weight combinations evaluated by one sensitivity sweep
+MAX_SWEEP_COMBINATIONS = 10000
+
+
+def _score(value):
+    if isinstance(value, dict):
+        value = value.get("score", 0)
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _mean(values, default=50):
+    return sum(values) / len(values) if values else default
+
+
+def _citizen_row(evaluation):
+    return {
+        "evaluator_name": evaluation.get("evaluator_name"),
+        "age": evaluation.get("age"),
+        "gender": evaluation.get("gender"),
+        "stance": evaluation.get("stance"),
+        "is_directly_affected": evaluation.get("is_directly_affected", True),
+        "scores": {dimension: _score(evaluation.get(dimension)) for dimension in CITIZEN_DIMENSIONS}
+    }
+
+
+def _read_spilled_citizens(spill):
+    path = (spill or {}).get("path")
+    if not path or not os.path.exists(path):
+        return None
+    rows = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            if record["kind"] == "citizen_evaluation" and "error" not in record["data"]:
+                rows.append(_citizen_row(record["data"]))
+    return rows
+
+
+def load_score_table(result_json):
+    """Score table of a stored run (rebuilt from citizen_evaluations for runs stored without one)"""
+    score_table = copy.deepcopy(result_json.get("score_table") or {})
+    score_table.setdefault("weights", DEFAULT_WEIGHTS)
+
+    if "citizens" not in score_table:
+        if "citizen_evaluations" in result_json:
+            score_table["citizens"] = [_citizen_row(e) for e in result_json["citizen_evaluations"] if "error" not in e]
+        else:
+            score_table["citizens"] = _read_spilled_citizens(result_json.get("evaluation_spill"))
+        if score_table["citizens"] is None:
+            raise ValueError("Per-citizen scores are not available for this run (spill file not found)")
+
+    final_assessment = result_json.get("final_assessment") or {}
+    if "final_assessment" not in score_table:
+        score_table["final_assessment"] = {dimension: _score(final_assessment.get(dimension)) for dimension in DEFAULT_WEIGHTS["final"]}
+    if "total_score" not in score_table["final_assessment"]:
+        score_table["final_assessment"]["total_score"] = _score(final_assessment.get("total_score"))
+    if "review" not in score_table:
+        review_result = result_json.get("review_result") or {}
+        score_table["review"] = {dimension: _score(review_result.get(dimension)) for dimension in DEFAULT_WEIGHTS["review"]}
+    if "citizen_averages" not in score_table:
+        score_table["citizen_averages"] = {
+            dimension: _mean([c["scores"][dimension] for c in score_table["citizens"] if c["scores"].get(dimension) is not None])
+            for dimension in CITIZEN_DIMENSIONS
+        }
+    return score_table
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def _check_value(label, group, value):
+    """Citizen shares must lie in [0, 1]; every other weight and threshold must be >= 0"""
+    if not _is_number(value):
+        raise ValueError(f"{label} must be a number")
+    if group == "citizen_share":
+        if not 0 <= value <= 1:
+            raise ValueError(f"{label} must be between 0 and 1")
+    elif value < 0:
+        raise ValueError(f"{label} must not be negative")
+
+
+def validate_weights(overrides):
+    """Check weight overrides against the known groups, keys and value ranges (raises ValueError)"""
+    if overrides is None:
+        return
+    if not isinstance(overrides, dict):
+        raise ValueError("weights must be an object")
+    for key, value in overrides.items():
+        if key not in DEFAULT_WEIGHTS:
+            raise ValueError(f"Unknown weight group: {key}")
+        if isinstance(DEFAULT_WEIGHTS[key], dict):
+            if not isinstance(value, dict):
+                raise ValueError(f"weights.{key} must be an object")
+            for name, weight in value.items():
+                if name not in DEFAULT_WEIGHTS[key]:
+                    raise ValueError(f"Unknown weight: {key}.{name}")
+                _check_value(f"weights.{key}.{name}", key, weight)
+        else:
+            _check_value(f"weights.{key}", key, value)
+
+
+def merge_weights(base, overrides):
+    """Weights with overrides applied (nested dicts are merged key by key)"""
+    merged = copy.deepcopy(base)
+    for key, value in (overrides or {}).items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = {**merged[key], **value}
+        else:
+            merged[key] = value
+    return merged
+
+
+def select_citizens(citizens, segment="all", where=None):
+    """Citizens in a segment whose fields equal every value in where"""
+    if segment not in SEGMENTS:
+        raise ValueError(f"Unknown segment: {segment}")
+    if where is not None and not isinstance(where, dict):
+        raise ValueError("where must be an object")
+    selected = []
+    for citizen in citizens:
+        if segment == "directly_affected" and citizen.get("is_directly_affected") is False:
+            continue
+        if segment == "not_directly_affected" and citizen.get("is_directly_affected") is not False:
+            continue
+        if any(citizen.get(field) != value for field, value in (where or {}).items()):
+            continue
+        selected.append(citizen)
+    return selected
+
+
+def _expert_part(stored_score, citizen_average, share):
+    """Part of a final score not taken from citizens, derived from the stored score and its original citizen share"""
+    if stored_score is None:
+        return citizen_average
+    if share >= 1:
+        return stored_score
+    return min(max((stored_score - share * citizen_average) / (1 - share), 0), 100)
+
+
+def recommendation_for(total_score, thresholds):
+    if total_score >= thresholds["recommended"]:
+        return "Recommended"
+    if total_score >= thresholds["conditional"]:
+        return "Conditionally recommended"
+    return "Reconsideration recommended"
+
+
+def _prepare(score_table, segment, where):
+    """Weight-independent part of a rescoring: selected citizens and their averages"""
+    citizens = select_citizens(score_table["citizens"], segment, where)
+    if not citizens:
+        # Averages would silently fall back to 50 for every dimension
+        raise ValueError("No citizens match the selected segment and filters")
+    averages = {
+        dimension: _mean([c["scores"][dimension] for c in citizens if c["scores"].get(dimension) is not None])
+        for dimension in CITIZEN_DIMENSIONS
+    }
+    return {
+        "citizens": citizens,
+        "averages": averages,
+        "original_weights": merge_weights(DEFAULT_WEIGHTS, score_table.get("weights")),
+        "stored": score_table["final_assessment"],
+        "original_averages": score_table["citizen_averages"],
+        "review": score_table.get("review") or {}
+    }
+
+
+def _score_totals(prepared, weights):
+    averages = prepared["averages"]
+    stored = prepared["stored"]
+    components = {
+        "effectiveness": sum(weight * averages[dimension] for dimension, weight in weights["effectiveness"].items()),
+        "transparency": stored.get("transparency") or 0,
+        "ethical_acceptability": stored.get("ethical_acceptability") or 0
+    }
+    for component, citizen_dimension in (("equity", "fairness"), ("sustainability", "sustainability")):
+        expert = _expert_part(stored.get(component), prepared["original_averages"][citizen_dimension], prepared["original_weights"]["citizen_share"][component])
+        share = weights["citizen_share"][component]
+        components[component] = share * averages[citizen_dimension] + (1 - share) * expert
+
+    total_score = sum(weight * components.get(component, 0) for component, weight in weights["final"].items())
+    review_score = sum(weight * (prepared["review"].get(dimension) or 0) for dimension, weight in weights["review"].items())
+    return components, total_score, review_score
+
+
+def _baseline(prepared):
+    """Selection rescored with the run's own weights, next to the total the evaluator reported"""
+    weights = prepared["original_weights"]
+    components, total_score, review_score = _score_totals(prepared, weights)
+    return {
+        "components": {component: round(value, 2) for component, value in components.items()},
+        "total_score": round(total_score, 2),
+        "recommendation": recommendation_for(total_score, weights["recommendation_thresholds"]),
+        "review": {
+            "total_score": round(review_score, 2),
+            "approved": review_score >= weights["review_approval_threshold"]
+        },
+        "stored_total_score": prepared["stored"].get("total_score")
+    }
+
+
+def rescore(score_table, weights=None, segment="all", where=None, include_citizens=True):
+    """Recompute citizen ratings, Step 6 components, final total and review approval under other weights
+
+    Transparency and ethical acceptability are taken as stored. For equity and sustainability the
+    evaluator's own part is derived from the stored score using the share it was computed with, then
+    combined with the (re-filtered) citizen average using the new share.
+    """
+    validate_weights(weights)
+    prepared = _prepare(score_table, segment, where)
+    weights = merge_weights(prepared["original_weights"], weights)
+    components, total_score, review_score = _score_totals(prepared, weights)
+
+    result = {
+        "segment": segment,
+        "citizen_count": len(prepared["citizens"]),
+        "citizen_averages": {dimension: round(value, 2) for dimension, value in prepared["averages"].items()},
+        "components": {component: round(value, 2) for component, value in components.items()},
+        "total_score": round(total_score, 2),
+        "recommendation": recommendation_for(total_score, weights["recommendation_thresholds"]),
+        "review": {
+            "total_score": round(review_score, 2),
+            "approved": review_score >= weights["review_approval_threshold"]
+        },
+        "weights": weights,
+        "baseline": _baseline(prepared)
+    }
+    if include_citizens:
+        citizen_ratings = []
+        for citizen in prepared["citizens"]:
+            scores = citizen["scores"]
+            rating = sum(weight * (scores.get(dimension) or 0) for dimension, weight in weights["citizen_overall"].items())
+            citizen_ratings.append({"evaluator_name": citizen.get("evaluator_name"), "is_directly_affected": citizen.get("is_directly_affected"), "overall_rating": round(rating, 2)})
+        result["citizen_ratings"] = citizen_ratings
+    return result
+
+
+def _grid_override(key):
+    """Split a grid key into (group, name); name is None for top-level keys"""
+    group, _, name = key.partition(".")
+    if group not in DEFAULT_WEIGHTS:
+        raise ValueError(f"Unknown weight group in grid: {key}")
+    if isinstance(DEFAULT_WEIGHTS[group], dict):
+        if name not in DEFAULT_WEIGHTS[group]:
+            raise ValueError(f"Unknown weight in grid: {key}")
+        return group, name
+    if name:
+        raise ValueError(f"Unknown weight in grid: {key}")
+    return group, None
+
+
+def sensitivity_sweep(score_table, grid, weights=None, segment="all", where=None):
+    """Rescore every combination of a weight grid
+
+    grid maps "group.key" (e.g. "final.equity") or a top-level key (e.g. "review_approval_threshold")
+    to the list of values to try. Citizens are selected and averaged once for the whole sweep.
+    """
+    if not isinstance(grid, dict) or not grid:
+        raise ValueError("grid must be a non-empty object")
+    validate_weights(weights)
+    keys = list(grid)
+    targets = [_grid_override(key) for key in keys]
+    combinations = 1
+    for key, (group, _) in zip(keys, targets):
+        values = grid[key]
+        if not isinstance(values, list) or not values:
+            raise ValueError(f"grid.{key} must be a non-empty list")
+        for value in values:
+            _check_value(f"grid.{key} values", group, value)
+        combinations *= len(values)
+    if combinations > MAX_SWEEP_COMBINATIONS:
+        raise ValueError(f"Too many weight combinations ({combinations} > {MAX_SWEEP_COMBINATIONS})")
+
+    prepared = _prepare(score_table, segment, where)
+    base_weights = merge_weights(prepared["original_weights"], weights)
+
+    results = []
+    for values in itertools.product(*(grid[key] for key in keys)):
+        combination_weights = {key: dict(value) if isinstance(value, dict) else value for key, value in base_weights.items()}
+        for (group, name), value in zip(targets, values):
+            if name is None:
+                combination_weights[group] = value
+            else:
+                combination_weights[group][name] = value
+        _, total_score, review_score = _score_totals(prepared, combination_weights)
+        results.append({
+            "values": dict(zip(keys, values)),
+            "total_score": round(total_score, 2),
+            "recommendation": recommendation_for(total_score, combination_weights["recommendation_thresholds"]),
+            "review_approved": review_score >= combination_weights["review_approval_threshold"]
+        })
+
+    totals = [r["total_score"] for r in results]
+    return {
+        "segment": segment,
+        "citizen_count": len(prepared["citizens"]),
+        "combinations": len(results),
+        "min_total_score": min(totals) if totals else None,
+        "max_total_score": max(totals) if totals else None,
+        "baseline": _baseline(prepared),
+        "results": results
+    }
@@ -0,0 +1,188 @@
+import json
+import os
+import sqlite3
+import uuid
+import zlib
+from datetime import date, datetime, timedelta, timezone
+
+RESULTS_DB = os.environ.get('RESULTS_DB', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results.db'))
+# Local copies of the evaluations streamed by each run (the runtime's own spill file is not reachable from here)
+EVALUATION_SPILL_DIR = os.environ.get('EVALUATION_SPILL_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'spills'))
+
+# Columns returned by list queries (large compressed fields are only loaded by get_run / get_transcript)
+SUMMARY_COLUMNS = ['id', 'created_at', 'target_area', 'policy_title', 'total_score', 'recommendation', 'user_message']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    target_area TEXT,
+    policy_title TEXT,
+    total_score REAL,
+    recommendation TEXT,
+    user_message TEXT,
+    result_json BLOB NOT NULL,
+    transcript BLOB
+);
+CREATE INDEX IF NOT EXISTS idx_runs_target_area ON runs (target_area);
+CREATE INDEX IF NOT EXISTS idx_runs_policy_title ON runs (policy_title);
+CREATE INDEX IF NOT EXISTS idx_runs_total_score ON runs (total_score);
+CREATE INDEX IF NOT EXISTS idx_runs_recommendation ON runs (recommendation);
+CREATE INDEX IF NOT EXISTS idx_runs_created_at ON runs (created_at);
+"""
+
+
+def _connect(db_path=None):
+    """Open a connection to the results database, creating the schema if needed"""
+    conn = sqlite3.connect(db_path or RESULTS_DB)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def _compress(value):
+    return zlib.compress(json.dumps(value, ensure_ascii=False).encode('utf-8'))
+
+
+def _decompress(blob):
+    if blob is None:
+        return None
+    return json.loads(zlib.decompress(blob).decode('utf-8'))
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def spill_path(run_id):
+    """Path of the local evaluation spill file of a run (JSON Lines, same format as the runtime's)"""
+    os.makedirs(EVALUATION_SPILL_DIR, exist_ok=True)
+    return os.path.join(EVALUATION_SPILL_DIR, f"{run_id}.jsonl")
+
+
+def save_run(result_json, transcript=None, run_id=None, db_path=None):
+    """Persist a completed run (the `complete` event payload) and return its id"""
+    run_id = run_id or str(uuid.uuid4())
+    demographics = result_json.get('demographics_data') or {}
+    policy = result_json.get('policy_proposal') or {}
+    final_assessment = result_json.get('final_assessment') or {}
+
+    conn = _connect(db_path)
+    try:
+        with conn:
+            conn.execute(
+                """INSERT OR REPLACE INTO runs
+                   (id, created_at, target_area, policy_title, total_score, recommendation, user_message, result_json, transcript)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (
+                    run_id,
+                    datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                    demographics.get('target_area'),
+                    policy.get('policy_title'),
+                    _to_float(final_assessment.get('total_score')),
+                    final_assessment.get('recommendation'),
+                    result_json.get('user_message'),
+                    _compress(result_json),
+                    _compress(transcript) if transcript is not None else None,
+                )
+            )
+    finally:
+        conn.close()
+    return run_id
+
+
+def list_runs(filters=None, page=1, per_page=20, db_path=None):
+    """List stored runs (summary columns only) matching the filters, newest first"""
+    filters = filters or {}
+    clauses = []
+    params = []
+
+    if filters.get('target_area'):
+        clauses.append("target_area = ?")
+        params.append(filters['target_area'])
+    if filters.get('policy_title'):
+        clauses.append("policy_title LIKE ? ESCAPE '\\'")
+        params.append(f"%{_escape_like(filters['policy_title'])}%")
+    if filters.get('recommendation'):
+        clauses.append("recommendation = ?")
+        params.append(filters['recommendation'])
+    if filters.get('min_score') is not None:
+        clauses.append("total_score >= ?")
+        params.append(filters['min_score'])
+    if filters.get('max_score') is not None:
+        clauses.append("total_score <= ?")
+        params.append(filters['max_score'])
+    if filters.get('date_from'):
+        clauses.append("created_at >= ?")
+        params.append(filters['date_from'])
+    if filters.get('date_to'):
+        date_to = filters['date_to']
+        try:
+            # A bare date (YYYY-MM-DD) includes the whole day
+            next_day = (date.fromisoformat(date_to) + timedelta(days=1)).isoformat()
+        except ValueError:
+            next_day = None
+        if next_day:
+            clauses.append("created_at < ?")
+            params.append(next_day)
+        else:
+            clauses.append("created_at <= ?")
+            params.append(date_to)
+
+    where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+    page = max(page, 1)
+    per_page = max(min(per_page, 100), 1)
+
+    conn = _connect(db_path)
+    try:
+        total = conn.execute(f"SELECT COUNT(*) FROM runs{where}", params).fetchone()[0]
+        rows = conn.execute(
+            f"SELECT {', '.join(SUMMARY_COLUMNS)} FROM runs{where} ORDER BY created_at DESC LIMIT ? OFFSET ?",
+            params + [per_page, (page - 1) * per_page]
+        ).fetchall()
+    finally:
+        conn.close()
+
+    return {
+        "runs": [dict(row) for row in rows],
+        "total": total,
+        "page": page,
+        "per_page": per_page
+    }
+
+
+def get_run(run_id, db_path=None):
+    """Fetch a stored run with its full result_json (without the transcript)"""
+    conn = _connect(db_path)
+    try:
+        row = conn.execute(
+            f"SELECT {', '.join(SUMMARY_COLUMNS)}, result_json FROM runs WHERE id = ?", (run_id,)
+        ).fetchone()
+    finally:
+        conn.close()
+
+    if row is None:
+        return None
+    run = {column: row[column] for column in SUMMARY_COLUMNS}
+    run["result_json"] = _decompress(row["result_json"])
+    return run
+
+
+def get_transcript(run_id, db_path=None):
+    """Fetch the stream transcript of a stored run (None if the run does not exist)"""
+    conn = _connect(db_path)
+    try:
+        row = conn.execute("SELECT transcript FROM runs WHERE id = ?", (run_id,)).fetchone()
+    finally:
+        conn.close()
+
+    if row is None:
+        return None
+    return _decompress(row["transcript"]) or {}
@@ -3,17 +3,137 @@ import json
 import boto3
 from botocore.config import Config
 import os
+import threading
 import uuid
+import live_runs
+import rescoring
+import results_store
 
 app = Flask(__name__)
 
 AGENT_ARN = os.environ.get('AGENT_ARN', 'arn:aws:bedrock-agentcore:us-west-2:047786098634:runtime/multi_agent_app_enhanced_en-T99YAUB3Aq')
 REGION = os.environ.get('AWS_REGION', 'us-west-2')
 
+# Streamed event types written to the local evaluation spill file (and their record kind)
+SPILL_KINDS = {'evaluation': 'citizen_evaluation', 'future_evaluation': 'future_evaluation'}
+
 @app.route('/')
 def index():
     return render_template('index_en.html')
 
+def run_pipeline(run, prompt):
+    """Invoke the agent runtime and publish its events to the live run (independent of any client connection)"""
+    spill_path = None
+    keep_spill = False
+    try:
+        config = Config(
+            read_timeout=3600,
+            connect_timeout=60,
+            retries={'max_attempts': 0}
+        )
+        
+        agent_core_client = boto3.client('bedrock-agentcore', region_name=REGION, config=config)
+        
+        payload = json.dumps({"prompt": prompt}).encode()
+        session_id = str(uuid.uuid4()) + str(uuid.uuid4())[:5]
+        
+        response = agent_core_client.invoke_agent_runtime(
+            agentRuntimeArn=AGENT_ARN,
+            runtimeSessionId=session_id,
+            payload=payload
+        )
+        
+        content_type = response.get('contentType', '')
+        
+        if "text/event-stream" in content_type:
+            transcript = {}
+            completed_result = None
+            # Evaluations are also written to a local spill file, so runs whose complete event
+            # only refers to the runtime's spill file keep their evaluations on this side
+            spill_path = results_store.spill_path(run.run_id)
+            spill_records = 0
+            with open(spill_path, 'a', encoding='utf-8') as spill_file:
+                for line in response["response"].iter_lines(chunk_size=10):
+                    if line:
+                        line = line.decode("utf-8")
+                        if line.startswith("data: "):
+                            line = line[6:]
+                            # Publish as-is without JSON parsing
+                            run.publish(line)
+                            
+                            # Record the stream transcript, evaluations and the completed result for the results store
+                            try:
+                                event = json.loads(line)
+                            except json.JSONDecodeError:
+                                continue
+                            if not isinstance(event, dict):
+                                continue
+                            if event.get('type') == 'stream':
+                                step = event.get('step', 'unknown')
+                                transcript.setdefault(step, []).append(str(event.get('data', '')))
+                            elif event.get('type') in SPILL_KINDS:
+                                spill_file.write(json.dumps({'kind': SPILL_KINDS[event['type']], 'data': event.get('data')}, ensure_ascii=False) + '\n')
+                                spill_records += 1
+                            elif event.get('type') == 'complete':
+                                completed_result = event.get('data')
+            
+            if completed_result and 'evaluation_spill' in completed_result:
+                completed_result['evaluation_spill'] = {
+                    'path': spill_path,
+                    'records': spill_records,
+                    'format': 'jsonl',
+                    'location': 'web_app',
+                    'runtime_path': completed_result['evaluation_spill'].get('path')
+                }
+            
+            if completed_result:
+                transcript = {step: ''.join(chunks) for step, chunks in transcript.items()}
+                run_id = results_store.save_run(completed_result, transcript, run_id=run.run_id)
+                keep_spill = 'evaluation_spill' in completed_result
+                run.publish(json.dumps({'type': 'saved', 'data': {'run_id': run_id}}))
+        
+        elif content_type == "application/json":
+            content = []
+            for chunk in response.get("response", []):
+                content.append(chunk.decode('utf-8'))
+            
+            result_str = ''.join(content)
+            
+            # Try JSON parsing
+            try:
+                result = json.loads(result_str)
+                if 'error' in result:
+                    run.publish(json.dumps({'type': 'error', 'data': result['error']}))
+                else:
+                    run.publish(json.dumps(result))
+            except json.JSONDecodeError as e:
+                # If JSON parse error, send raw data
+                run.publish(json.dumps({'type': 'raw', 'data': result_str}))
+        
+        else:
+            run.publish(json.dumps({'type': 'error', 'data': f'Unknown content type: {content_type}'}))
+            
+    except Exception as e:
+        run.publish(json.dumps({'type': 'error', 'data': str(e)}))
+    finally:
+        # The local spill file is only kept when a saved run refers to it
+        if spill_path and not keep_spill:
+            try:
+                os.remove(spill_path)
+            except FileNotFoundError:
+                pass
+        run.finish()
+
+def stream_run(run, last_event_id=0):
+    """Server-sent events of a run after last_event_id"""
+    for event_id, data in run.events_after(last_event_id):
+        if data is None:
+            yield ": keep-alive\n\n"
+        elif event_id is None:
+            yield f"data: {data}\n\n"
+        else:
+            yield f"id: {event_id}\ndata: {data}\n\n"
+
 @app.route('/api/evaluate', methods=['POST'])
 def evaluate():
     try:
@@ -23,62 +143,118 @@ def evaluate():
         if not prompt:
             return jsonify({'error': 'Prompt is required'}), 400
         
-        def generate():
-            try:
-                config = Config(
-                    read_timeout=3600,
-                    connect_timeout=60,
-                    retries={'max_attempts': 0}
-                )
-                
-                agent_core_client = boto3.client('bedrock-agentcore', region_name=REGION, config=config)
-                
-                payload = json.dumps({"prompt": prompt}).encode()
-                session_id = str(uuid.uuid4()) + str(uuid.uuid4())[:5]
-                
-                response = agent_core_client.invoke_agent_runtime(
-                    agentRuntimeArn=AGENT_ARN,
-                    runtimeSessionId=session_id,
-                    payload=payload
-                )
-                
-                content_type = response.get('contentType', '')
-                
-                if "text/event-stream" in content_type:
-                    for line in response["response"].iter_lines(chunk_size=10):
-                        if line:
-                            line = line.decode("utf-8")
-                            if line.startswith("data: "):
-                                line = line[6:]
-                                # Send as-is without JSON parsing
-                                yield f"data: {line}\n\n"
-                
-                elif content_type == "application/json":
-                    content = []
-                    for chunk in response.get("response", []):
-                        content.append(chunk.decode('utf-8'))
-                    
-                    result_str = ''.join(content)
-                    
-                    # Try JSON parsing
-                    try:
-                        result = json.loads(result_str)
-                        if 'error' in result:
-                            yield f"data: {json.dumps({'type': 'error', 'data': result['error']})}\n\n"
-                        else:
-                            yield f"data: {json.dumps(result)}\n\n"
-                    except json.JSONDecodeError as e:
-                        # If JSON parse error, send raw data
-                        yield f"data: {json.dumps({'type': 'raw', 'data': result_str})}\n\n"
-                
-                else:
-                    yield f"data: {json.dumps({'type': 'error', 'data': f'Unknown content type: {content_type}'})}\n\n"
-                    
-            except Exception as e:
-                yield f"data: {json.dumps({'type': 'error', 'data': str(e)})}\n\n"
+        run = live_runs.create_run()
+        run.publish(json.dumps({'type': 'run', 'data': {'run_id': run.run_id}}))
+        threading.Thread(target=run_pipeline, args=(run, prompt), daemon=True).start()
+        
+        return Response(stream_run(run), mimetype='text/event-stream', headers={'X-Run-Id': run.run_id})
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/evaluate/live', methods=['GET'])
+def list_live_runs():
+    return jsonify({'runs': live_runs.list_runs()})
+
+@app.route('/api/evaluate/<run_id>/events', methods=['GET'])
+def attach_run(run_id):
+    try:
+        run = live_runs.get_run(run_id)
+        if run is None:
+            return jsonify({'error': 'Run not found'}), 404
         
-        return Response(generate(), mimetype='text/event-stream')
+        # Resume after the last event the client received (EventSource sends Last-Event-ID on reconnect)
+        last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id') or 0
+        try:
+            last_event_id = int(last_event_id)
+        except ValueError:
+            return jsonify({'error': 'Invalid Last-Event-ID'}), 400
+        
+        return Response(stream_run(run, last_event_id), mimetype='text/event-stream', headers={'X-Run-Id': run.run_id})
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/runs', methods=['GET'])
+def list_runs():
+    try:
+        filters = {
+            'target_area': request.args.get('target_area'),
+            'policy_title': request.args.get('policy_title'),
+            'recommendation': request.args.get('recommendation'),
+            'min_score': request.args.get('min_score', type=float),
+            'max_score': request.args.get('max_score', type=float),
+            'date_from': request.args.get('date_from'),
+            'date_to': request.args.get('date_to')
+        }
+        page = request.args.get('page', 1, type=int)
+        per_page = request.args.get('per_page', 20, type=int)
+        return jsonify(results_store.list_runs(filters, page=page, per_page=per_page))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/runs/<run_id>', methods=['GET'])
+def get_run(run_id):
+    try:
+        run = results_store.get_run(run_id)
+        if run is None:
+            return jsonify({'error': 'Run not found'}), 404
+        return jsonify(run)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/runs/<run_id>/transcript', methods=['GET'])
+def get_run_transcript(run_id):
+    try:
+        transcript = results_store.get_transcript(run_id)
+        if transcript is None:
+            return jsonify({'error': 'Run not found'}), 404
+        return jsonify({'run_id': run_id, 'transcript': transcript})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def json_object_body():
+    """Request body as a dict (an empty body counts as {}); None if it is not a JSON object"""
+    if not request.get_data():
+        return {}
+    data = request.get_json(force=True, silent=True)
+    return data if isinstance(data, dict) else None
+
+@app.route('/api/runs/<run_id>/rescore', methods=['POST'])
+def rescore_run(run_id):
+    try:
+        run = results_store.get_run(run_id)
+        if run is None:
+            return jsonify({'error': 'Run not found'}), 404
+        
+        data = json_object_body()
+        if data is None:
+            return jsonify({'error': 'Request body must be a JSON object'}), 400
+        score_table = rescoring.load_score_table(run['result_json'])
+        result = rescoring.rescore(score_table, data.get('weights'), data.get('segment', 'all'), data.get('where'))
+        return jsonify({'run_id': run_id, **result})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/runs/<run_id>/sensitivity', methods=['POST'])
+def sensitivity_run(run_id):
+    try:
+        run = results_store.get_run(run_id)
+        if run is None:
+            return jsonify({'error': 'Run not found'}), 404
         
+        data = json_object_body()
+        if data is None:
+            return jsonify({'error': 'Request body must be a JSON object'}), 400
+        if not data.get('grid'):
+            return jsonify({'error': 'grid is required'}), 400
+        score_table = rescoring.load_score_table(run['result_json'])
+        result = rescoring.sensitivity_sweep(score_table, data['grid'], data.get('weights'), data.get('segment', 'all'), data.get('where'))
+        return jsonify({'run_id': run_id, **result})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -0,0 +1,96 @@
+"""Cold-start benchmark for the AgentCore entrypoint
+
+Runs the module in fresh interpreters and measures, per startup mode:
+- import_s: time to import multi_agent_app_enhanced_en
+- first_event_s: time from the request to the first streamed event
+- request_ready_s: time from the request until strands is loaded and agents can be created
+- time_to_first_event_s: import_s + first_event_s (a request arriving right at boot)
+
+The request is sent BENCH_IDLE_S seconds (default 2) after the import, like a container that
+boots and then waits for its first request; the idle time is not included in any metric.
+
+Usage: python bench_cold_start.py [runs]
+Exits with status 1 if lazy / warm-up mode does not reach the first event sooner than eager mode,
+or if warm-up mode does not make agents ready sooner after the request than lazy mode.
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+PROBE = """
+import asyncio, json, os, time
+t0 = time.perf_counter()
+import multi_agent_app_enhanced_en as m
+t1 = time.perf_counter()
+time.sleep(float(os.environ.get("BENCH_IDLE_S", "2")))
+t1_request = time.perf_counter()
+
+async def first_event():
+    gen = m.invoke_async_streaming({"prompt": "benchmark"})
+    await gen.__anext__()
+    t2 = time.perf_counter()
+    await gen.aclose()
+    return t2
+
+t2 = asyncio.run(first_event())
+m.load_strands()
+t3 = time.perf_counter()
+print(json.dumps({"import_s": t1 - t0, "first_event_s": t2 - t1_request, "request_ready_s": t3 - t1_request}))
+"""
+
+MODES = {
+    "eager": {"LAZY_IMPORTS": "0", "WARMUP_ON_BOOT": "0"},
+    "lazy": {"LAZY_IMPORTS": "1", "WARMUP_ON_BOOT": "0"},
+    "warmup": {"LAZY_IMPORTS": "1", "WARMUP_ON_BOOT": "1"}
+}
+
+
+def run_probe(env_overrides):
+    env = {**os.environ, **env_overrides}
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    results = {}
+    for mode, env_overrides in MODES.items():
+        samples = [run_probe(env_overrides) for _ in range(runs)]
+        results[mode] = {
+            metric: round(statistics.median(sample[metric] for sample in samples), 4)
+            for metric in ("import_s", "first_event_s", "request_ready_s")
+        }
+        results[mode]["time_to_first_event_s"] = round(results[mode]["import_s"] + results[mode]["first_event_s"], 4)
+
+    print(json.dumps(results, indent=2))
+    eager_first = results["eager"]["time_to_first_event_s"]
+    failed = False
+    for mode in ("lazy", "warmup"):
+        first = results[mode]["time_to_first_event_s"]
+        print(f"Time to first event: eager {eager_first:.3f}s, {mode} {first:.3f}s ({eager_first - first:+.3f}s saved)")
+        if first >= eager_first:
+            print(f"{mode} mode did not reduce the time to first event")
+            failed = True
+
+    lazy_ready = results["lazy"]["request_ready_s"]
+    warmup_ready = results["warmup"]["request_ready_s"]
+    print(f"Agents ready after the request: lazy {lazy_ready:.3f}s, warmup {warmup_ready:.3f}s, eager {results['eager']['request_ready_s']:.3f}s")
+    if warmup_ready >= lazy_ready:
+        print("warmup mode did not make agents ready sooner than lazy mode")
+        failed = True
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+import json
+import math
+import os
+import tempfile
+import uuid
+
+# Set SPILL_EVALUATIONS=1 to write evaluations to an append-only file instead of keeping them in memory
+SPILL_EVALUATIONS = os.environ.get('SPILL_EVALUATIONS', '0') == '1'
+SPILL_DIR = os.environ.get('SPILL_DIR', tempfile.gettempdir())
+
+CITIZEN_DIMENSIONS = ["personal_impact", "family_impact", "community_impact", "fairness", "sustainability", "overall_rating"]
+FUTURE_DIMENSIONS = ["ten_year_rating"]
+
+SEGMENTS = ["all", "directly_affected", "not_directly_affected"]
+
+
+class RunningStats:
+    """Count, mean and variance of a stream of values (Welford's algorithm)"""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def summary(self):
+        variance = self.m2 / self.count if self.count else 0.0
+        return {
+            "count": self.count,
+            "mean": round(self.mean, 3) if self.count else None,
+            "variance": round(variance, 3),
+            "stddev": round(math.sqrt(variance), 3)
+        }
+
+
+def score_value(evaluation, dimension):
+    """Numeric score of a dimension ({"score": ..} or a bare number), None if absent or not numeric"""
+    value = evaluation.get(dimension)
+    if isinstance(value, dict):
+        value = value.get("score", 0)
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class EvaluationAggregator:
+    """Running per-dimension statistics, split by is_directly_affected"""
+
+    def __init__(self, dimensions):
+        self.dimensions = dimensions
+        self.evaluations = 0
+        self.errors = 0
+        self.stats = {segment: {dimension: RunningStats() for dimension in dimensions} for segment in SEGMENTS}
+
+    def add(self, evaluation, is_directly_affected=True):
+        self.evaluations += 1
+        if "error" in evaluation:
+            self.errors += 1
+            return
+        segment = "directly_affected" if is_directly_affected is not False else "not_directly_affected"
+        for dimension in self.dimensions:
+            value = score_value(evaluation, dimension)
+            if value is None:
+                continue
+            self.stats["all"][dimension].add(value)
+            self.stats[segment][dimension].add(value)
+
+    def mean(self, dimension, default=50):
+        stats = self.stats["all"][dimension]
+        return stats.mean if stats.count else default
+
+    def summary(self):
+        return {
+            "evaluations": self.evaluations,
+            "errors": self.errors,
+            "segments": {
+                segment: {dimension: stats.summary() for dimension, stats in dimensions.items()}
+                for segment, dimensions in self.stats.items()
+            }
+        }
+
+
+class EvaluationSpill:
+    """Append-only JSON Lines file holding every evaluation of a run"""
+
+    def __init__(self, directory=None):
+        directory = directory or SPILL_DIR
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"evaluations_{uuid.uuid4().hex}.jsonl")
+        self.records = 0
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def append(self, kind, data):
+        self._file.write(json.dumps({"kind": kind, "data": data}, ensure_ascii=False) + "\n")
+        self._file.flush()
+        self.records += 1
+
+    def close(self):
+        # Safe to call more than once (closing a closed file is a no-op)
+        self._file.close()
+
+    def reference(self):
+        # The path is on the machine running the pipeline (the AgentCore runtime container),
+        # not on whoever consumes the complete event
+        return {"path": self.path, "records": self.records, "format": "jsonl", "location": "runtime"}
+
+
+def read_spill(path, kind=None):
+    """Iterate over the evaluations stored in a spill file (optionally only one kind)"""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            if kind is None or record["kind"] == kind:
+                yield record["data"]
@@ -1,47 +1,73 @@
 ﻿from bedrock_agentcore import BedrockAgentCoreApp
-from strands import Agent
-from strands_tools import swarm
 import json
+import os
 import re
 import asyncio
+import threading
+from prompt_cache import PrefixReuseMeter, build_prompt
+from evaluation_spill import CITIZEN_DIMENSIONS, FUTURE_DIMENSIONS, SPILL_EVALUATIONS, EvaluationAggregator, EvaluationSpill, score_value
+
+# strands / strands_tools are imported on first use so that a new runtime container can start
+# serving (and send the first event) before paying for them.
+# Set LAZY_IMPORTS=0 to import them at module load instead.
+LAZY_IMPORTS = os.environ.get('LAZY_IMPORTS', '1') == '1'
+# Set WARMUP_ON_BOOT=1 to import them in the background as soon as the process starts
+WARMUP_ON_BOOT = os.environ.get('WARMUP_ON_BOOT', '0') == '1'
+
+MODEL_ID = "us.anthropic.claude-sonnet-4-20250514-v1:0"
+
+# Scoring weights and thresholds (the prompts state the same values); stored with every run
+# in score_table so that results can be rescored locally under other weights (UI/rescoring.py)
+CITIZEN_OVERALL_WEIGHTS = {"personal_impact": 0.5, "family_impact": 0.2, "community_impact": 0.1, "fairness": 0.1, "sustainability": 0.1}
+EFFECTIVENESS_WEIGHTS = {"personal_impact": 0.5, "family_impact": 0.2, "community_impact": 0.1}
+# Share of the final equity / sustainability scores taken directly from citizen fairness / sustainability
+CITIZEN_SHARE = {"equity": 0.5, "sustainability": 0.5}
+FINAL_WEIGHTS = {"equity": 0.25, "effectiveness": 0.25, "transparency": 0.20, "sustainability": 0.15, "ethical_acceptability": 0.10}
+REVIEW_WEIGHTS = {"legal_compliance": 0.5, "feasibility": 0.5}
+REVIEW_APPROVAL_THRESHOLD = 80
+RECOMMENDATION_THRESHOLDS = {"recommended": 70, "conditional": 50}
+
+def percent(weight):
+    """Weight as a percentage for prompts (0.25 -> 25%)"""
+    return f"{weight * 100:g}%"
+
+JSON_BLOCK_PATTERN = re.compile(r'```json\s*({.*?})\s*```', re.DOTALL)
 
 app = BedrockAgentCoreApp()
 
-def extract_json(message):
-    """Extract the JSON part from the message"""
-    if isinstance(message, dict):
-        if 'content' in message and isinstance(message['content'], list):
-            text = message['content'][0].get('text', '')
-        else:
-            text = str(message)
-    else:
-        text = str(message)
-    
-    json_match = re.search(r'```json\s*({.*?})\s*```', text, re.DOTALL)
-    if json_match:
-        return json.loads(json_match.group(1))
-    
-    try:
-        return json.loads(text)
-    except:
-        return None
-
-async def invoke_async_streaming(payload):
-    """Multi-agent policy system (extended version, streaming supported)"""
-    try:
-        user_message = payload.get("prompt", "")
-        
-        if not user_message:
-            yield {"type": "error", "data": "A prompt is required."}
-            return
-        
-        # Step 0: Investigation of similar policies
-        yield {"type": "status", "data": "[Step 0] Investigating similar policies from other municipalities..."}
-        
-        research_agent = Agent(
-            model="us.anthropic.claude-sonnet-4-20250514-v1:0",
-            callback_handler=None,
-            system_prompt="""You are a research expert specializing in municipal policies.  
+_strands = None
+_strands_lock = threading.Lock()
+
+def load_strands():
+    """Import strands Agent and the swarm tool once and return them"""
+    global _strands
+    if _strands is None:
+        with _strands_lock:
+            if _strands is None:
+                from strands import Agent
+                from strands_tools import swarm
+                _strands = (Agent, swarm)
+    return _strands
+
+def warm_up():
+    """Pay the deferred imports before the first request arrives"""
+    load_strands()
+
+if not LAZY_IMPORTS:
+    load_strands()
+elif WARMUP_ON_BOOT:
+    # Started at import time so it also applies when the runtime imports this module instead of running it
+    threading.Thread(target=warm_up, daemon=True).start()
+
+# Shared system prompt for citizen agents: the persona is given at the end of each prompt
+# so that every citizen call starts with the same prefix (system prompt + policy + instructions)
+CITIZEN_SYSTEM_PROMPT = """You are a virtual citizen taking part in a municipal policy evaluation panel.
+Evaluate the policy strictly from the standpoint of the citizen described under "Your position" at the end of the message.
+Stay in character and base your evaluation on that citizen's life, family, values and circumstances.
+
+IMPORTANT: Respond entirely in English."""
+
+RESEARCH_SYSTEM_PROMPT = """You are a research expert specializing in municipal policies.  
 Please investigate existing cases of policies related to citizen opinions and present relevant examples as references.
 
 IMPORTANT: Respond entirely in English.
@@ -61,26 +87,8 @@ Output Format:
   "search_scope": "Tokyo / Other municipalities / Nationwide Japan"
 }
 ```"""
-        )
-        
-        research_response = ""
-        async for event in research_agent.stream_async(f"Citizen opinions: {user_message}\n\nFirst, please investigate similar policy cases in Tokyo. If there are no such cases in Tokyo, then investigate about three cases from other municipalities or from across Japan."):
-            if "data" in event:
-                chunk = event["data"]
-                yield {"type": "stream", "step": "research", "data": chunk}
-                research_response += chunk
-        
-        research_result = extract_json(research_response) or {"similar_policies": [], "has_references": False}
-        yield {"type": "research", "data": research_result}
-        yield {"type": "stream", "step": "research_complete", "data": f"\n\n[Investigation complete] Similar policies: {len(research_result.get('similar_policies', []))} cases"}
-        
-        # Step 1a: Demographic survey
-        yield {"type": "status", "data": "[Step 1a] Investigating the demographic trends of the target area..."}
-        
-        demographics_agent = Agent(
-            model="us.anthropic.claude-sonnet-4-20250514-v1:0",
-            callback_handler=None,
-            system_prompt="""You are a demographic statistics expert.  
+
+DEMOGRAPHICS_SYSTEM_PROMPT = """You are a demographic statistics expert.  
 Identify the target area based on citizen opinions and investigate the demographic trends of that area.
 
 IMPORTANT: Respond entirely in English.
@@ -145,56 +153,8 @@ Output format:
 ```
 
 Note: Please make sure to describe data_source as a string. Do not use objects or arrays."""
-        )
-        
-        demographics_response = ""
-        async for event in demographics_agent.stream_async(f"Citizen opinion: {user_message}\n\nFirst, investigate the demographic trends of Tokyo. If data for Tokyo is unavailable, use statistics from other municipalities or from all of Japan. If no data exists, calculate a reasonable estimate using Fermi estimation. Clearly specify the estimation method in the data_source."):
-            if "data" in event:
-                chunk = event["data"]
-                yield {"type": "stream", "step": "demographics", "data": chunk}
-                demographics_response += chunk
-        
-        demographics_data = extract_json(demographics_response)
-        if not demographics_data:
-            yield {"type": "error", "data": "Failed to obtain demographic data."}
-            return
-        yield {"type": "demographics", "data": demographics_data}
-        language_distribution = demographics_data.get('language_distribution', [])
-        language_summary = ", ".join(
-            f"{entry.get('language', 'Unknown')}: {entry.get('percentage', '?')}%"
-            for entry in language_distribution[:3]
-        ) or "Unknown"
-        japanese_proficiency = demographics_data.get('japanese_proficiency_levels', {})
-        proficiency_summary = ", ".join(
-            f"{level}: {percentage}%"
-            for level, percentage in japanese_proficiency.items()
-        ) or "Unknown"
-        yield {"type": "stream", "step": "demographics_complete", "data": (
-            f"\n\n[Investigation complete] Target area: {demographics_data.get('target_area', 'Unknown')}"
-            f"\nAge distribution: {json.dumps(demographics_data.get('age_distribution', {}), ensure_ascii=False)}"
-            f"\nGender ratio: {json.dumps(demographics_data.get('gender_ratio', {}), ensure_ascii=False)}"
-            f"\nMain languages: {language_summary}"
-            f"\nJapanese proficiency: {proficiency_summary}"
-        )}
-        
-        # Step 1b: SV agent generates agent definitions (based on the investigated demographic trends)
-        yield {"type": "status", "data": "[Step 1b] Generating agent definitions..."}
-        
-        demographics_text = f"""
-Target area: {demographics_data.get('target_area', '不明')}
-Age distribution: {json.dumps(demographics_data.get('age_distribution', {}), ensure_ascii=False)}
-Gender ratio: {json.dumps(demographics_data.get('gender_ratio', {}), ensure_ascii=False)}
-Family structure: {json.dumps(demographics_data.get('family_types', []), ensure_ascii=False)}
-Language distribution: {json.dumps(demographics_data.get('language_distribution', []), ensure_ascii=False)}
-Japanese proficiency: {json.dumps(demographics_data.get('japanese_proficiency_levels', {}), ensure_ascii=False)}
-Cultural considerations: {json.dumps(demographics_data.get('cultural_considerations', []), ensure_ascii=False)}
-Priority services: {json.dumps(demographics_data.get('priority_services', []), ensure_ascii=False)}
-"""
-        
-        sv_agent = Agent(
-            model="us.anthropic.claude-sonnet-4-20250514-v1:0",
-            callback_handler=None,
-            system_prompt="""Analyze citizen opinions and design the agents necessary for policy consideration.
+
+SV_SYSTEM_PROMPT = """Analyze citizen opinions and design the agents necessary for policy consideration.
 
 IMPORTANT: Respond entirely in English.
 
@@ -257,7 +217,153 @@ Notes:
 - In system_prompt, clearly state the specific perspective, such as “from the standpoint of Tokyo.”
 - is_directly_affected indicates whether the agent receives direct benefits from the policy (true = receives benefits, false = does not / unrelated group).
 - For citizen agents, write all JSON field names in English."""
-        )
+
+FINAL_EVALUATOR_SYSTEM_PROMPT = f"""You are a policy evaluation specialist.
+Please evaluate the policy from the following five perspectives:
+
+1. Transparency & Accountability – Weight: {percent(FINAL_WEIGHTS["transparency"])}
+2. Ethical Acceptability & Social Acceptance – Weight: {percent(FINAL_WEIGHTS["ethical_acceptability"])}
+3. Effectiveness & Results – Weight: {percent(FINAL_WEIGHTS["effectiveness"])} (directly reflect citizen evaluation: {percent(EFFECTIVENESS_WEIGHTS["personal_impact"])} personal impact, {percent(EFFECTIVENESS_WEIGHTS["family_impact"])} family impact, {percent(EFFECTIVENESS_WEIGHTS["community_impact"])} community impact)
+4. Equity – Weight: {percent(FINAL_WEIGHTS["equity"])} ({percent(CITIZEN_SHARE["equity"])} of this is directly reflected from citizen evaluation of fairness)
+5. Sustainability & Cost Efficiency – Weight: {percent(FINAL_WEIGHTS["sustainability"])} ({percent(CITIZEN_SHARE["sustainability"])} of this is directly reflected from citizen evaluation of sustainability)
+
+Output format:
+```json
+{{
+  "equity": {{"score": 75, "comment": "Evaluation comment"}},
+  "effectiveness": {{"score": 80, "comment": "Evaluation comment"}},
+  "transparency": {{"score": 70, "comment": "Evaluation comment"}},
+  "sustainability": {{"score": 65, "comment": "Evaluation comment"}},
+  "ethical_acceptability": {{"score": 85, "comment": "Evaluation comment"}},
+  "total_score": 75.5,
+  "overall_comment": "Overall evaluation comment",
+  "recommendation": "Recommended / Conditionally recommended / Reconsideration recommended"
+}}
+```
+
+Important: Be sure to calculate total_score using the following formula:
+total_score = equity.score × {FINAL_WEIGHTS["equity"]:.2f} + effectiveness.score × {FINAL_WEIGHTS["effectiveness"]:.2f} + transparency.score × {FINAL_WEIGHTS["transparency"]:.2f} + sustainability.score × {FINAL_WEIGHTS["sustainability"]:.2f} + ethical_acceptability.score × {FINAL_WEIGHTS["ethical_acceptability"]:.2f}
+
+IMPORTANT: Write all content in English."""
+
+# Agent configurations for the fixed-role agents (system prompts do not depend on the request)
+AGENT_CONFIGS = {
+    "research": {"model": MODEL_ID, "callback_handler": None, "system_prompt": RESEARCH_SYSTEM_PROMPT},
+    "demographics": {"model": MODEL_ID, "callback_handler": None, "system_prompt": DEMOGRAPHICS_SYSTEM_PROMPT},
+    "sv": {"model": MODEL_ID, "callback_handler": None, "system_prompt": SV_SYSTEM_PROMPT},
+    "final_evaluator": {"model": MODEL_ID, "callback_handler": None, "system_prompt": FINAL_EVALUATOR_SYSTEM_PROMPT}
+}
+
+def citizen_persona_text(agent_def):
+    """Persona-specific part of a citizen prompt (always placed after the shared prefix)"""
+    return f"""Your position:
+Name: {agent_def['name']}
+Age: {agent_def['age']}, Gender: {agent_def.get('gender', '')}, Family: {agent_def.get('family', '')}
+Occupation: {agent_def.get('occupation', '')}
+Residence: {agent_def.get('residence', '')}
+Values: {agent_def.get('values', '')}
+Stance: {agent_def.get('stance', '')}
+Profile: {agent_def['profile']}
+Role instructions: {agent_def['system_prompt']}"""
+
+def extract_json(message):
+    """Extract the JSON part from the message"""
+    if isinstance(message, dict):
+        if 'content' in message and isinstance(message['content'], list):
+            text = message['content'][0].get('text', '')
+        else:
+            text = str(message)
+    else:
+        text = str(message)
+    
+    json_match = JSON_BLOCK_PATTERN.search(text)
+    if json_match:
+        return json.loads(json_match.group(1))
+    
+    try:
+        return json.loads(text)
+    except:
+        return None
+
+async def invoke_async_streaming(payload):
+    """Multi-agent policy system (extended version, streaming supported)"""
+    spill = None
+    try:
+        user_message = payload.get("prompt", "")
+        
+        if not user_message:
+            yield {"type": "error", "data": "A prompt is required."}
+            return
+        
+        # Step 0: Investigation of similar policies
+        yield {"type": "status", "data": "[Step 0] Investigating similar policies from other municipalities..."}
+        
+        # Deferred imports (no-op after warm-up or the first request)
+        Agent, swarm = await asyncio.to_thread(load_strands)
+        
+        research_agent = Agent(**AGENT_CONFIGS["research"])
+        
+        research_response = ""
+        async for event in research_agent.stream_async(f"Citizen opinions: {user_message}\n\nFirst, please investigate similar policy cases in Tokyo. If there are no such cases in Tokyo, then investigate about three cases from other municipalities or from across Japan."):
+            if "data" in event:
+                chunk = event["data"]
+                yield {"type": "stream", "step": "research", "data": chunk}
+                research_response += chunk
+        
+        research_result = extract_json(research_response) or {"similar_policies": [], "has_references": False}
+        yield {"type": "research", "data": research_result}
+        yield {"type": "stream", "step": "research_complete", "data": f"\n\n[Investigation complete] Similar policies: {len(research_result.get('similar_policies', []))} cases"}
+        
+        # Step 1a: Demographic survey
+        yield {"type": "status", "data": "[Step 1a] Investigating the demographic trends of the target area..."}
+        
+        demographics_agent = Agent(**AGENT_CONFIGS["demographics"])
+        
+        demographics_response = ""
+        async for event in demographics_agent.stream_async(f"Citizen opinion: {user_message}\n\nFirst, investigate the demographic trends of Tokyo. If data for Tokyo is unavailable, use statistics from other municipalities or from all of Japan. If no data exists, calculate a reasonable estimate using Fermi estimation. Clearly specify the estimation method in the data_source."):
+            if "data" in event:
+                chunk = event["data"]
+                yield {"type": "stream", "step": "demographics", "data": chunk}
+                demographics_response += chunk
+        
+        demographics_data = extract_json(demographics_response)
+        if not demographics_data:
+            yield {"type": "error", "data": "Failed to obtain demographic data."}
+            return
+        yield {"type": "demographics", "data": demographics_data}
+        language_distribution = demographics_data.get('language_distribution', [])
+        language_summary = ", ".join(
+            f"{entry.get('language', 'Unknown')}: {entry.get('percentage', '?')}%"
+            for entry in language_distribution[:3]
+        ) or "Unknown"
+        japanese_proficiency = demographics_data.get('japanese_proficiency_levels', {})
+        proficiency_summary = ", ".join(
+            f"{level}: {percentage}%"
+            for level, percentage in japanese_proficiency.items()
+        ) or "Unknown"
+        yield {"type": "stream", "step": "demographics_complete", "data": (
+            f"\n\n[Investigation complete] Target area: {demographics_data.get('target_area', 'Unknown')}"
+            f"\nAge distribution: {json.dumps(demographics_data.get('age_distribution', {}), ensure_ascii=False)}"
+            f"\nGender ratio: {json.dumps(demographics_data.get('gender_ratio', {}), ensure_ascii=False)}"
+            f"\nMain languages: {language_summary}"
+            f"\nJapanese proficiency: {proficiency_summary}"
+        )}
+        
+        # Step 1b: SV agent generates agent definitions (based on the investigated demographic trends)
+        yield {"type": "status", "data": "[Step 1b] Generating agent definitions..."}
+        
+        demographics_text = f"""
+Target area: {demographics_data.get('target_area', '不明')}
+Age distribution: {json.dumps(demographics_data.get('age_distribution', {}), ensure_ascii=False)}
+Gender ratio: {json.dumps(demographics_data.get('gender_ratio', {}), ensure_ascii=False)}
+Family structure: {json.dumps(demographics_data.get('family_types', []), ensure_ascii=False)}
+Language distribution: {json.dumps(demographics_data.get('language_distribution', []), ensure_ascii=False)}
+Japanese proficiency: {json.dumps(demographics_data.get('japanese_proficiency_levels', {}), ensure_ascii=False)}
+Cultural considerations: {json.dumps(demographics_data.get('cultural_considerations', []), ensure_ascii=False)}
+Priority services: {json.dumps(demographics_data.get('priority_services', []), ensure_ascii=False)}
+"""
+        
+        sv_agent = Agent(**AGENT_CONFIGS["sv"])
         
         sv_response = ""
         async for event in sv_agent.stream_async(f"Citizen opinions: {user_message}\n\nDemographic data:\n{demographics_text}"):
@@ -286,7 +392,7 @@ Notes:
             reference_text = f"\n\nReference cases:\n{json.dumps(research_result['similar_policies'], ensure_ascii=False, indent=2)}\nPlease refer to the above cases."
         
         swarm_agent = Agent(
-            model="us.anthropic.claude-sonnet-4-20250514-v1:0",
+            model=MODEL_ID,
             tools=[swarm],
             callback_handler=None
         )
@@ -334,7 +440,7 @@ Output format:
         yield {"type": "status", "data": "[Step 3] Reviewing legal compliance and feasibility..."}
         
         reviewer_agent = Agent(
-            model="us.anthropic.claude-sonnet-4-20250514-v1:0",
+            model=MODEL_ID,
             system_prompt=agent_defs.get("reviewer_agent", {}).get("system_prompt", "Please review from the perspective of law and feasibility."),
             callback_handler=None
         )
@@ -360,8 +466,8 @@ Output format:
 }}
 ```
 
-Overall Score = Legal Compliance × 0.5 + Feasibility × 0.5  
-Approval Criteria: Approved if score is 80 or higher
+Overall Score = Legal Compliance × {REVIEW_WEIGHTS["legal_compliance"]:g} + Feasibility × {REVIEW_WEIGHTS["feasibility"]:g}  
+Approval Criteria: Approved if score is {REVIEW_APPROVAL_THRESHOLD} or higher
 
 Important: For overall_assessment and improvement_suggestions, use headings in 【】 and bullet points (・) for readability.
 """
@@ -379,10 +485,10 @@ Important: For overall_assessment and improvement_suggestions, use headings in 
             if "total_score" not in review_result:
                 legal_score = review_result.get("legal_compliance", {}).get("score", 0)
                 feasibility_score = review_result.get("feasibility", {}).get("score", 0)
-                review_result["total_score"] = legal_score * 0.5 + feasibility_score * 0.5
+                review_result["total_score"] = legal_score * REVIEW_WEIGHTS["legal_compliance"] + feasibility_score * REVIEW_WEIGHTS["feasibility"]
             
             # Approved if score is 80 or higher
-            review_result["approved"] = review_result["total_score"] >= 80
+            review_result["approved"] = review_result["total_score"] >= REVIEW_APPROVAL_THRESHOLD
             yield {"type": "review", "data": {**review_result, "attempt": attempt}}
             
             if review_result.get("approved", False):
@@ -433,36 +539,34 @@ ExpectedEffects: {policy_json.get('expected_effects', 'N/A')}
 ReferencedPolicies: {', '.join(policy_json.get('referenced_policies', []))}
 """
         
+        # With SPILL_EVALUATIONS=1 evaluations go to an append-only file and only running aggregates stay in memory
         citizen_evaluations = []
+        citizen_aggregator = EvaluationAggregator(CITIZEN_DIMENSIONS)
+        # Compact per-citizen score rows for local rescoring (not kept when spilling: the web app
+        # rebuilds them from its own copy of the streamed evaluations, keeping memory independent of the panel size)
+        citizen_score_rows = []
+        if SPILL_EVALUATIONS:
+            spill = EvaluationSpill()
+        prefix_meter = PrefixReuseMeter()
         
-        for i, agent_def in enumerate(agent_defs["citizen_agents"]):
-            yield {"type": "status", "data": f"[Step 4] Citizen {i+1}/{len(agent_defs['citizen_agents'])}: {agent_def['name']}"}
-            
-            citizen_agent = Agent(
-                model="us.anthropic.claude-sonnet-4-20250514-v1:0",
-                system_prompt=agent_def["system_prompt"],
-                callback_handler=None
-            )
-            
-            eval_prompt = f"""{policy_summary}
-
-Your position: {agent_def['profile']}
-Age: {agent_def['age']}, Gender: {agent_def.get('gender', '')}, Family: {agent_def.get('family', '')}
+        # Invariant prefix shared by every citizen (policy summary, instructions, schema)
+        eval_prefix = f"""{policy_summary}
 
 Please evaluate the above policy proposal from the following five perspectives, using a scale of 0 to 100 points for each.
 For each item, provide both a score and comments (specific reasons and explanation of impact).
+Answer as the citizen described under "Your position" below.
 
 Output format:
 ```json
 {{
-  "evaluator_name": "{agent_def['name']}",
-  "age": {agent_def['age']},
-  "gender": "{agent_def.get('gender', '')}",
-  "occupation": "{agent_def.get('occupation', '')}",
-  "residence": "{agent_def.get('residence', '')}",
-  "family": "{agent_def.get('family', '')}",
-  "values": "{agent_def.get('values', '')}",
-  "stance": "{agent_def.get('stance', '')}",
+  "evaluator_name": "Your name",
+  "age": 30,
+  "gender": "Your gender",
+  "occupation": "Your occupation",
+  "residence": "Your residence",
+  "family": "Your family structure",
+  "values": "Your values",
+  "stance": "Your stance",
   "personal_impact": {{"score": 75, "comment": "How this policy would affect your daily life (specifically, around 150 characters)"}},
   "family_impact": {{"score": 80, "comment": "How this policy would affect your family (specifically, around 150 characters)"}},
   "community_impact": {{"score": 70, "comment": "How this policy would affect your community (specifically, around 150 characters)"}},
@@ -475,11 +579,23 @@ Output format:
 }}
 ```
 
-Important: Be sure to output all of the above items.
+Important: Be sure to output all of the above items. Copy evaluator_name, age, gender, occupation, residence, family, values and stance from "Your position".
 IMPORTANT: Write all content in English.
 
-Overall Evaluation = Personal Impact × 0.5 + Family Impact × 0.2 + Community Impact × 0.1 + Fairness × 0.1 + Sustainability × 0.1
-"""
+Overall Evaluation = Personal Impact × {CITIZEN_OVERALL_WEIGHTS["personal_impact"]:g} + Family Impact × {CITIZEN_OVERALL_WEIGHTS["family_impact"]:g} + Community Impact × {CITIZEN_OVERALL_WEIGHTS["community_impact"]:g} + Fairness × {CITIZEN_OVERALL_WEIGHTS["fairness"]:g} + Sustainability × {CITIZEN_OVERALL_WEIGHTS["sustainability"]:g}"""
+        
+        for i, agent_def in enumerate(agent_defs["citizen_agents"]):
+            yield {"type": "status", "data": f"[Step 4] Citizen {i+1}/{len(agent_defs['citizen_agents'])}: {agent_def['name']}"}
+            
+            citizen_agent = Agent(
+                model=MODEL_ID,
+                system_prompt=CITIZEN_SYSTEM_PROMPT,
+                callback_handler=None
+            )
+            
+            eval_suffix = citizen_persona_text(agent_def)
+            eval_prompt = build_prompt(eval_prefix, eval_suffix)
+            prefix_meter.record("citizen_evaluation", CITIZEN_SYSTEM_PROMPT, eval_prompt)
             
             try:
                 eval_response = ""
@@ -491,44 +607,52 @@ Overall Evaluation = Personal Impact × 0.5 + Family Impact × 0.2 + Community I
                 
                 evaluation = extract_json(eval_response)
                 if evaluation:
+                    # Identity fields come from the agent definition, not from the model's echo of the schema
+                    for field in ("gender", "occupation", "residence", "family", "values", "stance"):
+                        evaluation[field] = agent_def.get(field, '')
+                    evaluation["evaluator_name"] = agent_def['name']
+                    evaluation["age"] = agent_def['age']
                     evaluation["is_directly_affected"] = agent_def.get("is_directly_affected", True)
-                    citizen_evaluations.append(evaluation)
+                    citizen_aggregator.add(evaluation, evaluation["is_directly_affected"])
+                    if spill:
+                        spill.append("citizen_evaluation", evaluation)
+                    else:
+                        citizen_evaluations.append(evaluation)
+                        citizen_score_rows.append({
+                            "evaluator_name": evaluation["evaluator_name"],
+                            "age": evaluation["age"],
+                            "gender": evaluation["gender"],
+                            "stance": evaluation["stance"],
+                            "is_directly_affected": evaluation["is_directly_affected"],
+                            "scores": {dimension: score_value(evaluation, dimension) for dimension in CITIZEN_OVERALL_WEIGHTS}
+                        })
                     yield {"type": "evaluation", "data": evaluation}
             except Exception as e:
-                citizen_evaluations.append({"evaluator_name": agent_def['name'], "error": str(e), "is_directly_affected": agent_def.get("is_directly_affected", True)})
+                error_evaluation = {"evaluator_name": agent_def['name'], "error": str(e), "is_directly_affected": agent_def.get("is_directly_affected", True)}
+                citizen_aggregator.add(error_evaluation, error_evaluation["is_directly_affected"])
+                if spill:
+                    spill.append("citizen_evaluation", error_evaluation)
+                else:
+                    citizen_evaluations.append(error_evaluation)
         
         # Step 5: 10-year evaluation (if not a temporary policy)
         future_evaluations = []
+        future_aggregator = EvaluationAggregator(FUTURE_DIMENSIONS)
         if not policy_json.get("is_temporary", False):
             yield {"type": "status", "data": "[Step 5] Simulating 10-year future evaluation..."}
             
-            total_citizens = len(agent_defs["citizen_agents"])
-            for i, agent_def in enumerate(agent_defs["citizen_agents"]):
-                yield {"type": "status", "data": f"[Step 5] 10-year evaluation {i+1}/{total_citizens}: {agent_def['name']}"}
-                
-                citizen_agent = Agent(
-                    model="us.anthropic.claude-sonnet-4-20250514-v1:0",
-                    system_prompt=agent_def["system_prompt"],
-                    callback_handler=None
-                )
-                
-                # Estimate the situation 10 years from now based on the current family structure
-                current_family = agent_def.get('family', '')
-                future_family_note = ""
-                if current_family:
-                    future_family_note = f"\n\nCurrent family structure: {current_family}\nPlease estimate the family structure 10 years from now (e.g., children become adults, move out, get married, etc.). Assume natural changes based on current age and circumstances."
-                
-                future_prompt = f"""{policy_summary}
+            # Invariant prefix shared by every citizen (policy summary, instructions, schema)
+            future_prefix = f"""{policy_summary}
 
-You are now {agent_def['age']+10} years old, 10 years have passed since the implementation of this policy. {future_family_note}
+10 years have passed since the implementation of this policy. Answer as the citizen described under "Your position" below, 10 years older than stated there.
 
 Please describe the changes over the past 10 years and your current evaluation.
 
 Output format:
 ```json
 {{
-  "evaluator_name": "{agent_def['name']} (10 years later)",
-  "age_now": {agent_def['age']+10},
+  "evaluator_name": "Your name (10 years later)",
+  "age_now": 40,
   "ten_year_rating": 75,
   "changes_observed": "Changes observed over 10 years (including changes in family structure",
   "long_term_impact": "Assessment of long-term impact",
@@ -540,8 +664,29 @@ Output format:
 Important:  
 - ten_year_rating should be evaluated on a 100-point scale.  
 - In changes_observed, be sure to include natural changes over 10 years in the family, such as children growing up, becoming independent, etc.
-- IMPORTANT: Write all content in English.
-"""
+- IMPORTANT: Write all content in English."""
+            
+            total_citizens = len(agent_defs["citizen_agents"])
+            for i, agent_def in enumerate(agent_defs["citizen_agents"]):
+                yield {"type": "status", "data": f"[Step 5] 10-year evaluation {i+1}/{total_citizens}: {agent_def['name']}"}
+                
+                citizen_agent = Agent(
+                    model=MODEL_ID,
+                    system_prompt=CITIZEN_SYSTEM_PROMPT,
+                    callback_handler=None
+                )
+                
+                # Estimate the situation 10 years from now based on the current family structure
+                current_family = agent_def.get('family', '')
+                future_family_note = ""
+                if current_family:
+                    future_family_note = f"\n\nCurrent family structure: {current_family}\nPlease estimate the family structure 10 years from now (e.g., children become adults, move out, get married, etc.). Assume natural changes based on current age and circumstances."
+                
+                future_suffix = f"""{citizen_persona_text(agent_def)}
+
+You are now {agent_def['age']+10} years old (evaluator_name: "{agent_def['name']} (10 years later)", age_now: {agent_def['age']+10}).{future_family_note}"""
+                future_prompt = build_prompt(future_prefix, future_suffix)
+                prefix_meter.record("future_evaluation", CITIZEN_SYSTEM_PROMPT, future_prompt)
                 
                 try:
                     future_response = ""
@@ -553,71 +698,59 @@ Important:
                     
                     future_eval = extract_json(future_response)
                     if future_eval:
-                        future_evaluations.append(future_eval)
+                        future_eval["evaluator_name"] = f"{agent_def['name']} (10 years later)"
+                        future_eval["age_now"] = agent_def['age'] + 10
+                        future_aggregator.add(future_eval, agent_def.get("is_directly_affected", True))
+                        if spill:
+                            spill.append("future_evaluation", future_eval)
+                        else:
+                            future_evaluations.append(future_eval)
                         yield {"type": "future_evaluation", "data": future_eval}
                 except Exception as e:
                     pass
         
+        prompt_cache_stats = prefix_meter.summary()
+        yield {"type": "prompt_cache", "data": prompt_cache_stats}
+        
         # Step6: Final evaluation
         yield {"type": "status", "data": "[Step 6] Calculating final evaluation..."}
         
-        # Aggregating each indicator from citizen evaluations
-        citizen_personal = [e.get("personal_impact", {}).get("score", 0) for e in citizen_evaluations if "personal_impact" in e]
-        citizen_family = [e.get("family_impact", {}).get("score", 0) for e in citizen_evaluations if "family_impact" in e]
-        citizen_community = [e.get("community_impact", {}).get("score", 0) for e in citizen_evaluations if "community_impact" in e]
-        citizen_fairness = [e.get("fairness", {}).get("score", 0) for e in citizen_evaluations if "fairness" in e]
-        citizen_sustainability = [e.get("sustainability", {}).get("score", 0) for e in citizen_evaluations if "sustainability" in e]
+        # Aggregating each indicator from citizen evaluations (running means, 50 if no scores)
+        effectiveness_personal = citizen_aggregator.mean("personal_impact")
+        effectiveness_family = citizen_aggregator.mean("family_impact")
+        effectiveness_community = citizen_aggregator.mean("community_impact")
         
         # Effectiveness and results score (directly reflecting citizen evaluations)
-        effectiveness_personal = (sum(citizen_personal) / len(citizen_personal)) if citizen_personal else 50
-        effectiveness_family = (sum(citizen_family) / len(citizen_family)) if citizen_family else 50
-        effectiveness_community = (sum(citizen_community) / len(citizen_community)) if citizen_community else 50
-        effectiveness_score = effectiveness_personal * 0.5 + effectiveness_family * 0.2 + effectiveness_community * 0.1
+        effectiveness_score = (
+            effectiveness_personal * EFFECTIVENESS_WEIGHTS["personal_impact"]
+            + effectiveness_family * EFFECTIVENESS_WEIGHTS["family_impact"]
+            + effectiveness_community * EFFECTIVENESS_WEIGHTS["community_impact"]
+        )
         
         # Fairness score (reflects 50% of citizen evaluations)
-        citizen_fairness_avg = (sum(citizen_fairness) / len(citizen_fairness)) if citizen_fairness else 50
+        citizen_fairness_avg = citizen_aggregator.mean("fairness")
         
         # Sustainability score (reflects 50% of citizen evaluations)
-        citizen_sustainability_avg = (sum(citizen_sustainability) / len(citizen_sustainability)) if citizen_sustainability else 50
+        citizen_sustainability_avg = citizen_aggregator.mean("sustainability")
         
-        final_evaluator = Agent(
-            model="us.anthropic.claude-sonnet-4-20250514-v1:0",
-            callback_handler=None,
-            system_prompt="""You are a policy evaluation specialist.
-Please evaluate the policy from the following five perspectives:
-
-1. Transparency & Accountability – Weight: 20%
-2. Ethical Acceptability & Social Acceptance – Weight: 10%
-3. Effectiveness & Results – Weight: 25% (directly reflect citizen evaluation: 50% personal impact, 20% family impact, 10% community impact)
-4. Equity – Weight: 25% (50% of this is directly reflected from citizen evaluation of fairness)
-5. Sustainability & Cost Efficiency – Weight: 15% (50% of this is directly reflected from citizen evaluation of sustainability)
-
-Output format:
-```json
-{{
-  "equity": {{"score": 75, "comment": "Evaluation comment"}},
-  "effectiveness": {{"score": 80, "comment": "Evaluation comment"}},
-  "transparency": {{"score": 70, "comment": "Evaluation comment"}},
-  "sustainability": {{"score": 65, "comment": "Evaluation comment"}},
-  "ethical_acceptability": {{"score": 85, "comment": "Evaluation comment"}},
-  "total_score": 75.5,
-  "overall_comment": "Overall evaluation comment",
-  "recommendation": "Recommended / Conditionally recommended / Reconsideration recommended"
-}}
-```
-
-Important: Be sure to calculate total_score using the following formula:
-total_score = equity.score × 0.25 + effectiveness.score × 0.25 + transparency.score × 0.20 + sustainability.score × 0.15 + ethical_acceptability.score × 0.10
-
-IMPORTANT: Write all content in English."""
-        )
+        evaluation_aggregates = {
+            "citizen": citizen_aggregator.summary(),
+            "future": future_aggregator.summary()
+        }
+        if spill:
+            # Only aggregates fit in the prompt for large panels
+            citizen_evaluation_text = f"(Individual evaluations omitted; per-dimension statistics split by is_directly_affected)\n{json.dumps(evaluation_aggregates['citizen'], ensure_ascii=False, indent=2)}"
+        else:
+            citizen_evaluation_text = json.dumps(citizen_evaluations, ensure_ascii=False, indent=2)
+        
+        final_evaluator = Agent(**AGENT_CONFIGS["final_evaluator"])
         
         final_prompt = f"""Policy proposal:
 {json.dumps(policy_json, ensure_ascii=False, indent=2)}
 
-Number of citizen evaluations: {len(citizen_evaluations)}
+Number of citizen evaluations: {citizen_aggregator.evaluations}
 Citizen evaluation data:
-{json.dumps(citizen_evaluations, ensure_ascii=False, indent=2)}
+{citizen_evaluation_text}
 
 Aggregated data from citizen evaluations:
 - Average personal impact: {effectiveness_personal:.1f} points
@@ -628,34 +761,34 @@ Aggregated data from citizen evaluations:
 
 Please evaluate the policy proposal from the following five perspectives:
 
-1. Transparency & Accountability – Weight: 20%
+1. Transparency & Accountability – Weight: {percent(FINAL_WEIGHTS["transparency"])}
    - Is the basis and process of decision-making clearly presented?
    - Evaluate the amount of supporting data and explainability.
 
-2. Ethical Acceptability & Social Acceptance – Weight: 10%
+2. Ethical Acceptability & Social Acceptance – Weight: {percent(FINAL_WEIGHTS["ethical_acceptability"])}
    - Is it appropriate from the viewpoints of human rights, privacy, and ethics?
 
-3. Effectiveness & Results – Weight: 25%
+3. Effectiveness & Results – Weight: {percent(FINAL_WEIGHTS["effectiveness"])}
    - Directly reflect citizen evaluation: {effectiveness_score:.1f} points
-   - Breakdown: Personal impact ({effectiveness_personal:.1f}) × 50% + Family impact ({effectiveness_family:.1f}) × 20% + Community impact ({effectiveness_community:.1f}) × 10%
+   - Breakdown: Personal impact ({effectiveness_personal:.1f}) × {percent(EFFECTIVENESS_WEIGHTS["personal_impact"])} + Family impact ({effectiveness_family:.1f}) × {percent(EFFECTIVENESS_WEIGHTS["family_impact"])} + Community impact ({effectiveness_community:.1f}) × {percent(EFFECTIVENESS_WEIGHTS["community_impact"])}
    - Use this score as is: {effectiveness_score:.1f} points
 
-4. Equity – Weight: 25%
-   - Average citizen fairness evaluation: {citizen_fairness_avg:.1f} points (this accounts for 50%)
-   - Does the policy provide benefits fairly across groups without bias? (remaining 50%)
+4. Equity – Weight: {percent(FINAL_WEIGHTS["equity"])}
+   - Average citizen fairness evaluation: {citizen_fairness_avg:.1f} points (this accounts for {percent(CITIZEN_SHARE["equity"])})
+   - Does the policy provide benefits fairly across groups without bias? (remaining {percent(1 - CITIZEN_SHARE["equity"])})
    - Evaluate distribution of support and correction of disparities.
 
-5. Sustainability & Cost Efficiency – Weight: 15%
-   - Average citizen sustainability evaluation: {citizen_sustainability_avg:.1f} points (this accounts for 50%)
-   - Is it sustainable from financial and human resource perspectives? (remaining 50%)
+5. Sustainability & Cost Efficiency – Weight: {percent(FINAL_WEIGHTS["sustainability"])}
+   - Average citizen sustainability evaluation: {citizen_sustainability_avg:.1f} points (this accounts for {percent(CITIZEN_SHARE["sustainability"])})
+   - Is it sustainable from financial and human resource perspectives? (remaining {percent(1 - CITIZEN_SHARE["sustainability"])})
    - Evaluate cost-effectiveness ratio and long-term impact.
 
-Total Score = Transparency × 0.20 + Ethical Acceptability × 0.10 + Effectiveness × 0.25 + Equity × 0.25 + Sustainability × 0.15
+Total Score = Transparency × {FINAL_WEIGHTS["transparency"]:.2f} + Ethical Acceptability × {FINAL_WEIGHTS["ethical_acceptability"]:.2f} + Effectiveness × {FINAL_WEIGHTS["effectiveness"]:.2f} + Equity × {FINAL_WEIGHTS["equity"]:.2f} + Sustainability × {FINAL_WEIGHTS["sustainability"]:.2f}
 
 Recommendation criteria:
-- 70 points or higher: Recommended
-- 50–69 points: Conditionally recommended
-- Below 50 points: Reconsideration recommended
+- {RECOMMENDATION_THRESHOLDS["recommended"]} points or higher: Recommended
+- {RECOMMENDATION_THRESHOLDS["conditional"]}–{RECOMMENDATION_THRESHOLDS["recommended"] - 1} points: Conditionally recommended
+- Below {RECOMMENDATION_THRESHOLDS["conditional"]} points: Reconsideration recommended
 """
         
         final_response = ""
@@ -668,6 +801,30 @@ Recommendation criteria:
         final_assessment = extract_json(final_response) or {"total_score": 0}
         yield {"type": "final_assessment", "data": final_assessment}
         
+        # Raw per-dimension scores in structured form for local what-if rescoring
+        score_table = {
+            "weights": {
+                "citizen_overall": CITIZEN_OVERALL_WEIGHTS,
+                "effectiveness": EFFECTIVENESS_WEIGHTS,
+                "citizen_share": CITIZEN_SHARE,
+                "final": FINAL_WEIGHTS,
+                "review": REVIEW_WEIGHTS,
+                "review_approval_threshold": REVIEW_APPROVAL_THRESHOLD,
+                "recommendation_thresholds": RECOMMENDATION_THRESHOLDS
+            },
+            "citizen_averages": {
+                "personal_impact": effectiveness_personal,
+                "family_impact": effectiveness_family,
+                "community_impact": effectiveness_community,
+                "fairness": citizen_fairness_avg,
+                "sustainability": citizen_sustainability_avg
+            },
+            "final_assessment": {dimension: score_value(final_assessment, dimension) for dimension in [*FINAL_WEIGHTS, "total_score"]},
+            "review": {dimension: score_value(review_result, dimension) for dimension in REVIEW_WEIGHTS}
+        }
+        if not spill:
+            score_table["citizens"] = citizen_score_rows
+        
         result_json = {
             "status": "success",
             "user_message": user_message,
@@ -682,15 +839,25 @@ Recommendation criteria:
             "review_result": review_result,
             "citizen_evaluations": citizen_evaluations,
             "future_evaluations": future_evaluations,
+            "evaluation_aggregates": evaluation_aggregates,
             "final_assessment": final_assessment,
+            "score_table": score_table,
             "execution_status": {
                 "completed": True,
                 "policy_agents_count": len(agent_defs["policy_agents"]),
                 "citizen_agents_count": len(agent_defs["citizen_agents"]),
-                "has_future_evaluation": len(future_evaluations) > 0
+                "has_future_evaluation": future_aggregator.evaluations > 0,
+                "prompt_cache": prompt_cache_stats
             }
         }
         
+        if spill:
+            spill.close()
+            # The complete event refers to the spill file instead of carrying the full lists
+            del result_json["citizen_evaluations"]
+            del result_json["future_evaluations"]
+            result_json["evaluation_spill"] = spill.reference()
+        
         yield {"type": "complete", "data": result_json}
     
     except Exception as e:
@@ -698,6 +865,10 @@ Recommendation criteria:
         error_msg = f"{str(e)}\n{traceback.format_exc()}"
         yield {"type": "error", "data": f"An error has occurred: {str(e)}"}
         print(f"\n\Error details:\n{error_msg}")
+    finally:
+        # Also reached when the consumer disconnects (GeneratorExit) or the task is cancelled
+        if spill:
+            spill.close()
 
 @app.entrypoint
 async def invoke(payload):
@@ -0,0 +1,90 @@
+import os
+import re
+
+# Set PROMPT_CACHE=1 to insert Bedrock prompt-cache checkpoints after the shared prompt prefix
+PROMPT_CACHE_ENABLED = os.environ.get('PROMPT_CACHE', '0') == '1'
+
+TOKEN_PATTERN = re.compile(r'\w+|[^\w\s]')
+
+
+def estimate_tokens(text):
+    """Rough token count (words and punctuation) used for local reuse measurement"""
+    return len(TOKEN_PATTERN.findall(text))
+
+
+def build_prompt(prefix, suffix, cache=None):
+    """Build a prompt with the invariant prefix first and the persona-specific suffix last
+
+    With caching enabled the prompt is returned as content blocks with a cachePoint
+    between the prefix and the suffix, otherwise as a plain string.
+    """
+    if cache is None:
+        cache = PROMPT_CACHE_ENABLED
+    if not cache:
+        return f"{prefix}\n\n{suffix}"
+    return [
+        {"text": prefix},
+        {"cachePoint": {"type": "default"}},
+        {"text": suffix}
+    ]
+
+
+def render_prompt(system_prompt, prompt):
+    """Full model input as text (system prompt followed by the prompt text, cachePoint blocks dropped)"""
+    if isinstance(prompt, list):
+        prompt = "\n\n".join(block["text"] for block in prompt if "text" in block)
+    return f"{system_prompt}\n\n{prompt}"
+
+
+class PrefixReuseMeter:
+    """Local stand-in for the provider prompt cache
+
+    Records the full rendered input of every call of a step and counts the tokens of the
+    longest common prefix with an earlier call of the same step (what a prefix cache could reuse).
+    Only the first call and the most recent calls of a step are compared, to keep memory bounded.
+    """
+
+    def __init__(self, history=16):
+        self.history = history
+        self.steps = {}
+
+    def record(self, step, system_prompt, prompt):
+        stats = self.steps.setdefault(step, {
+            "calls": 0,
+            "prompt_tokens": 0,
+            "prefix_tokens_reused": 0,
+            "_first": None,
+            "_recent": []
+        })
+        tokens = TOKEN_PATTERN.findall(render_prompt(system_prompt, prompt))
+        stats["calls"] += 1
+        stats["prompt_tokens"] += len(tokens)
+
+        earlier = ([stats["_first"]] if stats["_first"] is not None else []) + stats["_recent"]
+        reused = 0
+        for previous in earlier:
+            common = 0
+            for current, previous_token in zip(tokens, previous):
+                if current != previous_token:
+                    break
+                common += 1
+            reused = max(reused, common)
+        stats["prefix_tokens_reused"] += reused
+
+        if stats["_first"] is None:
+            stats["_first"] = tokens
+        else:
+            stats["_recent"] = (stats["_recent"] + [tokens])[-self.history:]
+
+    def summary(self):
+        """Per-step reuse statistics (JSON serializable)"""
+        result = {}
+        for step, stats in self.steps.items():
+            prompt_tokens = stats["prompt_tokens"]
+            result[step] = {
+                "calls": stats["calls"],
+                "prompt_tokens": prompt_tokens,
+                "prefix_tokens_reused": stats["prefix_tokens_reused"],
+                "reuse_ratio": round(stats["prefix_tokens_reused"] / prompt_tokens, 3) if prompt_tokens else 0
+            }
+        return result